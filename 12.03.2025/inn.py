@@ -1,29 +1,62 @@
-from enum import Enum, auto
-from fastapi import FastAPI, Depends
-from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, String, Enum as SQLAlchemyEnum
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from enum import Enum
+from typing import List
+import os
+import time
+from fastapi import FastAPI, Depends, Query
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import Column, String, Enum as SQLAlchemyEnum, Index, and_, event, update, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, load_only, raiseload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Подключение к базе данных
-DATABASE_URL = "sqlite:///./users.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./users.db")
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=8,
+    max_overflow=16,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    query_cache_size=1200,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-64000")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
 # Модель таблицы
 class UserDB(Base):
     __tablename__ = "users"
+    __table_args__ = (Index("ix_users_first_name_last_name", "first_name", "last_name"),)
     inn = Column(String, primary_key=True, index=True)
-    gender = Column(SQLAlchemyEnum("MALE", "FEMALE"), nullable=False)  # Строки "MALE" и "FEMALE"
-    name = Column(String, nullable=False)
+    gender = Column(SQLAlchemyEnum("MALE", "FEMALE"), nullable=False, index=True)  # Строки "MALE" и "FEMALE"
+    name = Column(String, nullable=False, index=True)
     first_name = Column(String, nullable=False)
-    last_name = Column(String, nullable=False)
-    address = Column(String, nullable=False)
+    last_name = Column(String, nullable=False, index=True)
+    address = Column(String, nullable=False, index=True)
 
-Base.metadata.create_all(bind=engine)
+@app.on_event("startup")
+async def create_tables():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in UserDB.__table__.indexes:
+            await connection.run_sync(index.create, checkfirst=True)
 
 # Pydantic модель
 class Gender(str, Enum):  # Наследуем от str для строковых значений
@@ -31,84 +64,120 @@ class Gender(str, Enum):  # Наследуем от str для строковы
     FEMALE = "FEMALE"
 
 class User_inn(BaseModel):
-    inn: str
+    inn: str = Field(pattern=r'^(?:[0-9]{10}|[0-9]{12})$')  # ИНН из 10 или 12 цифр
     gender: Gender
     name: str
     first_name: str
     last_name: str
     address: str
 
-    @validator("inn")
-    def validate_inn(cls, inn):
-        if not inn.isdigit():
-            raise ValueError("ИНН должен состоять только из цифр")
-        if len(inn) not in (10, 12):
-            raise ValueError("ИНН должен состоять из 10 или 12 цифр")
-        return inn
-
 # Зависимость для сессии
-def get_db():
+async def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+@app.on_event("startup")
+async def warm_up_pool():
+    connections = [await engine.connect() for _ in range(2)]
+    for connection in connections:
+        await connection.close()
+
+# Идентификаторы, которые заведомо есть в базе
+EXISTS_TTL_SECONDS = 60
+EXISTS_MAX_ENTRIES = 10000
+_existing_ids = {}
+
+def _known_to_exist(pk):
+    expires = _existing_ids.get(pk)
+    return expires is not None and expires > time.monotonic()
+
+def _remember_existing(pk):
+    if len(_existing_ids) >= EXISTS_MAX_ENTRIES:
+        _existing_ids.clear()
+    _existing_ids[pk] = time.monotonic() + EXISTS_TTL_SECONDS
 
 # Эндпоинты
 @app.get("/User")
-def get_user(
+async def get_user(
     user_inn: str = None,
     user_name: str = None,
     user_first_name: str = None,
     user_last_name: str = None,
     user_address: str = None,
-    user_gender: str = None,
-    db: Session = Depends(get_db)
+    user_gender: Gender = None,
+    fields: str = None,  # Список возвращаемых колонок через запятую
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    after: str = None,  # Keyset-пагинация: вернуть записи с inn больше указанного
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(UserDB)
-    if user_inn:
-        query = query.filter(UserDB.inn == user_inn)
-    if user_name:
-        query = query.filter(UserDB.name == user_name)
-    if user_first_name:
-        query = query.filter(UserDB.first_name == user_first_name)
-    if user_last_name:
-        query = query.filter(UserDB.last_name == user_last_name)
-    if user_address:
-        query = query.filter(UserDB.address == user_address)
-    if user_gender: 
-        query = query.filter(UserDB.gender == user_gender)
-    return query.all()
+    candidates = [
+        (UserDB.inn, user_inn),
+        (UserDB.name, user_name),
+        (UserDB.first_name, user_first_name),
+        (UserDB.last_name, user_last_name),
+        (UserDB.address, user_address),
+        (UserDB.gender, user_gender.value if user_gender else None),
+    ]
+    conditions = [column == value for column, value in candidates if value]
+    if after:
+        conditions.append(UserDB.inn > after)
+    query = select(UserDB).options(raiseload("*"))
+    if conditions:
+        query = query.where(and_(*conditions))
+    if fields:
+        names = [name.strip() for name in fields.split(",")]
+        unknown = [name for name in names if name not in UserDB.__table__.columns]
+        if unknown:
+            return f"Неизвестные поля: {', '.join(unknown)}"
+        query = query.options(load_only(*[getattr(UserDB, name) for name in names]))
+    query = query.order_by(UserDB.inn).limit(limit).offset(offset)
+    return (await db.scalars(query)).all()
 
 @app.post("/User")
-def create_user(new_user: User_inn, db: Session = Depends(get_db)):
-    db_user = db.query(UserDB).filter(UserDB.inn == new_user.inn).first()
-    if db_user:
+async def create_user(new_user: User_inn, db: AsyncSession = Depends(get_db)):
+    if _known_to_exist(new_user.inn):
+        return "Пользователь с таким ИНН уже существует"
+    stmt = sqlite_insert(UserDB).values(**new_user.dict()).on_conflict_do_nothing(index_elements=["inn"])
+    async with db.begin():
+        result = await db.execute(stmt)
+    _remember_existing(new_user.inn)
+    if result.rowcount == 0:
         return "Пользователь с таким ИНН уже существует"
-    db_user = UserDB(**new_user.dict())
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
     return "Пользователь успешно создан"
 
+@app.post("/User/bulk")
+async def create_users_bulk(new_users: List[User_inn], db: AsyncSession = Depends(get_db)):
+    created = 0
+    if new_users:
+        stmt = sqlite_insert(UserDB).on_conflict_do_nothing(index_elements=["inn"])
+        async with db.begin():
+            connection = await db.connection()
+            result = await connection.execute(stmt, [user.dict() for user in new_users])
+        for user in new_users:
+            _remember_existing(user.inn)
+        created = result.rowcount
+    return f"Создано пользователей: {created}, пропущено (ИНН уже существует): {len(new_users) - created}"
+
 @app.put("/User/{user_inn}")
-def update_user(user_inn: str, new_user: User_inn, db: Session = Depends(get_db)):
+async def update_user(user_inn: str, new_user: User_inn, db: AsyncSession = Depends(get_db)):
     if user_inn != new_user.inn:
         return "ИНН в теле запроса не совпадает с указанным в пути"
-    db_user = db.query(UserDB).filter(UserDB.inn == user_inn).first()
-    if not db_user:
+    result = await db.execute(update(UserDB).where(UserDB.inn == user_inn).values(**new_user.dict()))
+    await db.commit()
+    if result.rowcount == 0:
+        _existing_ids.pop(user_inn, None)
         return "Пользователя с таким ИНН не существует"
-    for key, value in new_user.dict().items():
-        setattr(db_user, key, value)
-    db.commit()
-    db.refresh(db_user)
     return "Пользователь успешно обновлён"
 
 @app.delete("/User/{user_inn}")
-def delete_user(user_inn: str, db: Session = Depends(get_db)):
-    db_user = db.query(UserDB).filter(UserDB.inn == user_inn).first()
-    if not db_user:
+async def delete_user(user_inn: str, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(delete(UserDB).where(UserDB.inn == user_inn))
+    await db.commit()
+    _existing_ids.pop(user_inn, None)
+    if result.rowcount == 0:
         return "Пользователя с таким ИНН не существует"
-    db.delete(db_user)
-    db.commit()
     return "Пользователь с таким ИНН удалён"
\ No newline at end of file
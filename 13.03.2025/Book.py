@@ -1,28 +1,62 @@
-from enum import Enum, auto
-from fastapi import FastAPI, Depends
-from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, String, Integer, Enum as SQLAlchemyEnum
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from enum import Enum
+from typing import List
+import os
+import time
+from fastapi import FastAPI, Depends, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import Column, String, Integer, Enum as SQLAlchemyEnum, Index, and_, event, update, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, load_only, raiseload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Подключение к базе данных
-DATABASE_URL = "sqlite:///./library.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./library.db")
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=8,
+    max_overflow=16,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    query_cache_size=1200,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-64000")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
 # Модель таблицы
 class BookDB(Base):
     __tablename__ = "books"
+    __table_args__ = (Index("ix_books_author_genre", "author", "genre"),)
     isbn = Column(String, primary_key=True, index=True)  # Уникальный идентификатор книги
-    genre = Column(SQLAlchemyEnum("FICTION", "NON_FICTION", "SCIENCE"), nullable=False)  # Жанр
-    title = Column(String, nullable=False)  # Название книги
+    genre = Column(SQLAlchemyEnum("FICTION", "NON_FICTION", "SCIENCE"), nullable=False, index=True)  # Жанр
+    title = Column(String, nullable=False, index=True)  # Название книги
     author = Column(String, nullable=False)  # Автор
     pages = Column(Integer, nullable=False)  # Количество страниц
 
-Base.metadata.create_all(bind=engine)
+@app.on_event("startup")
+async def create_tables():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in BookDB.__table__.indexes:
+            await connection.run_sync(index.create, checkfirst=True)
 
 # Pydantic модель
 class Genre(str, Enum):  # Жанры как строки
@@ -31,83 +65,151 @@ class Genre(str, Enum):  # Жанры как строки
     SCIENCE = "SCIENCE"
 
 class Book(BaseModel):
-    isbn: str
+    isbn: str = Field(pattern=r'^(?:[0-9]{10}|[0-9]{13})$')  # ISBN бывает 10 или 13 цифр
     genre: Genre
     title: str
     author: str
-    pages: int
-
-    @validator("isbn")
-    def validate_isbn(cls, isbn):
-        if not isbn.isdigit():
-            raise ValueError("ISBN должен состоять только из цифр")
-        if len(isbn) not in (10, 13):  # ISBN бывает 10 или 13 цифр
-            raise ValueError("ISBN должен состоять из 10 или 13 цифр")
-        return isbn
-
-    @validator("pages")
-    def validate_pages(cls, pages):
-        if pages <= 0:
-            raise ValueError("Количество страниц должно быть больше 0")
-        return pages
+    pages: int = Field(gt=0)
 
 # Зависимость для сессии
-def get_db():
+async def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+@app.on_event("startup")
+async def warm_up_pool():
+    connections = [await engine.connect() for _ in range(2)]
+    for connection in connections:
+        await connection.close()
+
+# Кэш ответов списочного GET
+CACHE_TTL_SECONDS = 30
+CACHE_MAX_ENTRIES = 1024
+_list_cache = {}
+_cache_generation = 0
+
+def _cache_get(key):
+    entry = _list_cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+def _cache_put(key, value, generation):
+    # Ответ, прочитанный до записи, завершившейся во время запроса, не кэшируется
+    if generation != _cache_generation:
+        return
+    if len(_list_cache) >= CACHE_MAX_ENTRIES:
+        _list_cache.clear()
+    _list_cache[key] = (time.monotonic() + CACHE_TTL_SECONDS, value)
+
+def _invalidate_list_cache():
+    global _cache_generation
+    _cache_generation += 1
+    _list_cache.clear()
+
+# Идентификаторы, которые заведомо есть в базе
+EXISTS_TTL_SECONDS = 60
+EXISTS_MAX_ENTRIES = 10000
+_existing_ids = {}
+
+def _known_to_exist(pk):
+    expires = _existing_ids.get(pk)
+    return expires is not None and expires > time.monotonic()
+
+def _remember_existing(pk):
+    if len(_existing_ids) >= EXISTS_MAX_ENTRIES:
+        _existing_ids.clear()
+    _existing_ids[pk] = time.monotonic() + EXISTS_TTL_SECONDS
 
 # Эндпоинты
 @app.get("/Book")
-def get_book(
+async def get_book(
     book_isbn: str = None,
     book_title: str = None,
     book_author: str = None,
-    book_genre: str = None,
-    db: Session = Depends(get_db)
+    book_genre: Genre = None,
+    fields: str = None,  # Список возвращаемых колонок через запятую
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    after: str = None,  # Keyset-пагинация: вернуть записи с isbn больше указанного
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(BookDB)
-    if book_isbn:
-        query = query.filter(BookDB.isbn == book_isbn)
-    if book_title:
-        query = query.filter(BookDB.title == book_title)
-    if book_author:
-        query = query.filter(BookDB.author == book_author)
-    if book_genre:
-        query = query.filter(BookDB.genre == book_genre)
-    return query.all()
+    cache_key = (book_isbn, book_title, book_author, book_genre, fields, limit, offset, after)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+    generation = _cache_generation
+    candidates = [
+        (BookDB.isbn, book_isbn),
+        (BookDB.title, book_title),
+        (BookDB.author, book_author),
+        (BookDB.genre, book_genre.value if book_genre else None),
+    ]
+    conditions = [column == value for column, value in candidates if value]
+    if after:
+        conditions.append(BookDB.isbn > after)
+    query = select(BookDB).options(raiseload("*"))
+    if conditions:
+        query = query.where(and_(*conditions))
+    if fields:
+        names = [name.strip() for name in fields.split(",")]
+        unknown = [name for name in names if name not in BookDB.__table__.columns]
+        if unknown:
+            return f"Неизвестные поля: {', '.join(unknown)}"
+        query = query.options(load_only(*[getattr(BookDB, name) for name in names]))
+    query = query.order_by(BookDB.isbn).limit(limit).offset(offset)
+    response = jsonable_encoder((await db.scalars(query)).all())
+    _cache_put(cache_key, response, generation)
+    return response
 
 @app.post("/Book")
-def create_book(new_book: Book, db: Session = Depends(get_db)):
-    db_book = db.query(BookDB).filter(BookDB.isbn == new_book.isbn).first()
-    if db_book:
+async def create_book(new_book: Book, db: AsyncSession = Depends(get_db)):
+    if _known_to_exist(new_book.isbn):
+        return "Книга с таким ISBN уже существует"
+    stmt = sqlite_insert(BookDB).values(**new_book.dict()).on_conflict_do_nothing(index_elements=["isbn"])
+    async with db.begin():
+        result = await db.execute(stmt)
+    _remember_existing(new_book.isbn)
+    _invalidate_list_cache()
+    if result.rowcount == 0:
         return "Книга с таким ISBN уже существует"
-    db_book = BookDB(**new_book.dict())
-    db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
     return "Книга успешно добавлена"
 
+@app.post("/Book/bulk")
+async def create_books_bulk(new_books: List[Book], db: AsyncSession = Depends(get_db)):
+    created = 0
+    if new_books:
+        stmt = sqlite_insert(BookDB).on_conflict_do_nothing(index_elements=["isbn"])
+        async with db.begin():
+            connection = await db.connection()
+            result = await connection.execute(stmt, [book.dict() for book in new_books])
+        for book in new_books:
+            _remember_existing(book.isbn)
+        _invalidate_list_cache()
+        created = result.rowcount
+    return f"Добавлено книг: {created}, пропущено (ISBN уже существует): {len(new_books) - created}"
+
 @app.put("/Book/{book_isbn}")
-def update_book(book_isbn: str, new_book: Book, db: Session = Depends(get_db)):
+async def update_book(book_isbn: str, new_book: Book, db: AsyncSession = Depends(get_db)):
     if book_isbn != new_book.isbn:
         return "ISBN в теле запроса не совпадает с указанным в пути"
-    db_book = db.query(BookDB).filter(BookDB.isbn == book_isbn).first()
-    if not db_book:
+    result = await db.execute(update(BookDB).where(BookDB.isbn == book_isbn).values(**new_book.dict()))
+    await db.commit()
+    _invalidate_list_cache()
+    if result.rowcount == 0:
+        _existing_ids.pop(book_isbn, None)
         return "Книги с таким ISBN не существует"
-    for key, value in new_book.dict().items():
-        setattr(db_book, key, value)
-    db.commit()
-    db.refresh(db_book)
     return "Книга успешно обновлена"
 
 @app.delete("/Book/{book_isbn}")
-def delete_book(book_isbn: str, db: Session = Depends(get_db)):
-    db_book = db.query(BookDB).filter(BookDB.isbn == book_isbn).first()
-    if not db_book:
+async def delete_book(book_isbn: str, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(delete(BookDB).where(BookDB.isbn == book_isbn))
+    await db.commit()
+    _existing_ids.pop(book_isbn, None)
+    _invalidate_list_cache()
+    if result.rowcount == 0:
         return "Книги с таким ISBN не существует"
-    db.delete(db_book)
-    db.commit()
     return "Книга успешно удалена"
\ No newline at end of file
@@ -1,15 +1,42 @@
 from enum import Enum as PyEnum
-from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, String, Integer, Enum as SQLAlchemyEnum
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from typing import List
+import os
+import time
+from fastapi import FastAPI, Depends, Query, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field, field_validator
+from sqlalchemy import Column, String, Integer, Enum as SQLAlchemyEnum, and_, event, update, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, load_only, raiseload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
-DATABASE_URL = "sqlite:///./movies.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./movies.db")
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=8,
+    max_overflow=16,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    query_cache_size=1200,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-64000")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
 class MovieGenre(str, PyEnum):
@@ -21,21 +48,28 @@ class MovieGenre(str, PyEnum):
 class MovieDB(Base):
     __tablename__ = "movies"
     movie_id = Column(String, primary_key=True, index=True)
-    genre = Column(SQLAlchemyEnum(MovieGenre), nullable=False)
-    title = Column(String, nullable=False)
-    director = Column(String, nullable=False)
+    genre = Column(SQLAlchemyEnum(MovieGenre), nullable=False, index=True)
+    title = Column(String, nullable=False, index=True)
+    director = Column(String, nullable=False, index=True)
     release_year = Column(Integer, nullable=False)
 
-Base.metadata.create_all(bind=engine)
+@app.on_event("startup")
+async def create_tables():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in MovieDB.__table__.indexes:
+            await connection.run_sync(index.create, checkfirst=True)
 
 class Movie(BaseModel):
     movie_id: str
     genre: MovieGenre
     title: str
     director: str
-    release_year: int
+    release_year: int = Field(ge=1888, le=2025)
 
-    @validator("movie_id")
+    @field_validator("movie_id")
+    @classmethod
     def validate_movie_id(cls, movie_id):
         if not movie_id.isalnum():
             raise ValueError("ID фильма должен состоять только из букв и цифр")
@@ -43,67 +77,143 @@ class Movie(BaseModel):
             raise ValueError("ID фильма должен быть длиной не менее 5 символов")
         return movie_id
 
-    @validator("release_year")
-    def validate_release_year(cls, release_year):
-        if release_year < 1888 or release_year > 2025:
-            raise ValueError("Год выпуска должен быть между 1888 и 2025")
-        return release_year
-
-def get_db():
+async def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+@app.on_event("startup")
+async def warm_up_pool():
+    connections = [await engine.connect() for _ in range(2)]
+    for connection in connections:
+        await connection.close()
+
+# Кэш ответов списочного GET
+CACHE_TTL_SECONDS = 30
+CACHE_MAX_ENTRIES = 1024
+_list_cache = {}
+_cache_generation = 0
+
+def _cache_get(key):
+    entry = _list_cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+def _cache_put(key, value, generation):
+    # Ответ, прочитанный до записи, завершившейся во время запроса, не кэшируется
+    if generation != _cache_generation:
+        return
+    if len(_list_cache) >= CACHE_MAX_ENTRIES:
+        _list_cache.clear()
+    _list_cache[key] = (time.monotonic() + CACHE_TTL_SECONDS, value)
+
+def _invalidate_list_cache():
+    global _cache_generation
+    _cache_generation += 1
+    _list_cache.clear()
+
+# Идентификаторы, которые заведомо есть в базе
+EXISTS_TTL_SECONDS = 60
+EXISTS_MAX_ENTRIES = 10000
+_existing_ids = {}
+
+def _known_to_exist(pk):
+    expires = _existing_ids.get(pk)
+    return expires is not None and expires > time.monotonic()
+
+def _remember_existing(pk):
+    if len(_existing_ids) >= EXISTS_MAX_ENTRIES:
+        _existing_ids.clear()
+    _existing_ids[pk] = time.monotonic() + EXISTS_TTL_SECONDS
 
 @app.get("/movies")
-def get_movies(
+async def get_movies(
     movie_id: str = None,
     title: str = None,
     director: str = None,
-    genre: str = None,
-    db: Session = Depends(get_db)
+    genre: MovieGenre = None,
+    fields: str = None,  # Список возвращаемых колонок через запятую
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    after: str = None,  # Keyset-пагинация: вернуть записи с movie_id больше указанного
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(MovieDB)
-    if movie_id:
-        query = query.filter(MovieDB.movie_id == movie_id)
-    if title:
-        query = query.filter(MovieDB.title == title)
-    if director:
-        query = query.filter(MovieDB.director == director)
-    if genre:
-        query = query.filter(MovieDB.genre == genre)
-    return query.all()
+    cache_key = (movie_id, title, director, genre, fields, limit, offset, after)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+    generation = _cache_generation
+    candidates = [
+        (MovieDB.movie_id, movie_id),
+        (MovieDB.title, title),
+        (MovieDB.director, director),
+        (MovieDB.genre, genre.value if genre else None),
+    ]
+    conditions = [column == value for column, value in candidates if value]
+    if after:
+        conditions.append(MovieDB.movie_id > after)
+    query = select(MovieDB).options(raiseload("*"))
+    if conditions:
+        query = query.where(and_(*conditions))
+    if fields:
+        names = [name.strip() for name in fields.split(",")]
+        unknown = [name for name in names if name not in MovieDB.__table__.columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(unknown)}")
+        query = query.options(load_only(*[getattr(MovieDB, name) for name in names]))
+    query = query.order_by(MovieDB.movie_id).limit(limit).offset(offset)
+    response = jsonable_encoder((await db.scalars(query)).all())
+    _cache_put(cache_key, response, generation)
+    return response
 
 @app.post("/movies")
-def create_movie(movie: Movie, db: Session = Depends(get_db)):
-    db_movie = db.query(MovieDB).filter(MovieDB.movie_id == movie.movie_id).first()
-    if db_movie:
+async def create_movie(movie: Movie, db: AsyncSession = Depends(get_db)):
+    if _known_to_exist(movie.movie_id):
+        raise HTTPException(status_code=400, detail="Фильм с таким ID уже существует")
+    stmt = sqlite_insert(MovieDB).values(**movie.dict()).on_conflict_do_nothing(index_elements=["movie_id"])
+    async with db.begin():
+        result = await db.execute(stmt)
+    _remember_existing(movie.movie_id)
+    _invalidate_list_cache()
+    if result.rowcount == 0:
         raise HTTPException(status_code=400, detail="Фильм с таким ID уже существует")
-    db_movie = MovieDB(**movie.dict())
-    db.add(db_movie)
-    db.commit()
-    db.refresh(db_movie)
     return {"message": "Фильм успешно создан"}
 
+@app.post("/movies/bulk")
+async def create_movies_bulk(movies: List[Movie], db: AsyncSession = Depends(get_db)):
+    created = 0
+    if movies:
+        stmt = sqlite_insert(MovieDB).on_conflict_do_nothing(index_elements=["movie_id"])
+        async with db.begin():
+            connection = await db.connection()
+            result = await connection.execute(stmt, [movie.dict() for movie in movies])
+        for movie in movies:
+            _remember_existing(movie.movie_id)
+        _invalidate_list_cache()
+        created = result.rowcount
+    return {"message": f"Создано фильмов: {created}, пропущено (ID уже существует): {len(movies) - created}"}
+
 @app.put("/movies/{movie_id}")
-def update_movie(movie_id: str, movie: Movie, db: Session = Depends(get_db)):
+async def update_movie(movie_id: str, movie: Movie, db: AsyncSession = Depends(get_db)):
     if movie_id != movie.movie_id:
         raise HTTPException(status_code=400, detail="ID фильма в пути и теле запроса не совпадают")
-    db_movie = db.query(MovieDB).filter(MovieDB.movie_id == movie_id).first()
-    if not db_movie:
+    result = await db.execute(update(MovieDB).where(MovieDB.movie_id == movie_id).values(**movie.dict()))
+    await db.commit()
+    _invalidate_list_cache()
+    if result.rowcount == 0:
+        _existing_ids.pop(movie_id, None)
         raise HTTPException(status_code=404, detail="Фильм не найден")
-    for key, value in movie.dict().items():
-        setattr(db_movie, key, value)
-    db.commit()
-    db.refresh(db_movie)
     return {"message": "Фильм успешно обновлен"}
 
 @app.delete("/movies/{movie_id}")
-def delete_movie(movie_id: str, db: Session = Depends(get_db)):
-    db_movie = db.query(MovieDB).filter(MovieDB.movie_id == movie_id).first()
-    if not db_movie:
+async def delete_movie(movie_id: str, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(delete(MovieDB).where(MovieDB.movie_id == movie_id))
+    await db.commit()
+    _existing_ids.pop(movie_id, None)
+    _invalidate_list_cache()
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Фильм не найден")
-    db.delete(db_movie)
-    db.commit()
     return {"message": "Фильм успешно удален"}
\ No newline at end of file
@@ -1,16 +1,42 @@
 from enum import Enum as PyEnum
-from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, String, Integer, Enum as SQLAlchemyEnum, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from typing import List
+import os
+import time
+from fastapi import FastAPI, Depends, Query, HTTPException
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, field_validator
+from sqlalchemy import Column, String, Enum as SQLAlchemyEnum, DateTime, Index, and_, event, update, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, load_only, raiseload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
-DATABASE_URL = "sqlite:///./tasks.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./tasks.db")
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=8,
+    max_overflow=16,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    query_cache_size=1200,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-64000")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
 class TaskStatus(str, PyEnum):
@@ -25,13 +51,20 @@ class TaskPriority(str, PyEnum):
 
 class TaskDB(Base):
     __tablename__ = "tasks"
+    __table_args__ = (Index("ix_tasks_status_priority", "status", "priority"),)
     task_id = Column(String, primary_key=True, index=True)
     status = Column(SQLAlchemyEnum(TaskStatus), nullable=False)
     description = Column(String, nullable=False)
-    priority = Column(SQLAlchemyEnum(TaskPriority), nullable=False)
+    priority = Column(SQLAlchemyEnum(TaskPriority), nullable=False, index=True)
     created_at = Column(DateTime, nullable=False)
 
-Base.metadata.create_all(bind=engine)
+@app.on_event("startup")
+async def create_tables():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in TaskDB.__table__.indexes:
+            await connection.run_sync(index.create, checkfirst=True)
 
 class Task(BaseModel):
     task_id: str
@@ -40,7 +73,8 @@ class Task(BaseModel):
     priority: TaskPriority
     created_at: datetime
 
-    @validator("task_id")
+    @field_validator("task_id")
+    @classmethod
     def validate_task_id(cls, task_id):
         if not task_id.isalnum():
             raise ValueError("ID задачи должен состоять только из букв и цифр")
@@ -48,70 +82,119 @@ class Task(BaseModel):
             raise ValueError("ID задачи должен быть длиной не менее 3 символов")
         return task_id
 
-    @validator("description")
+    @field_validator("description")
+    @classmethod
     def validate_description(cls, description):
         if len(description.strip()) < 5:
             raise ValueError("Описание задачи должно быть длиной не менее 5 символов")
         return description
 
-    @validator("created_at")
+    @field_validator("created_at")
+    @classmethod
     def validate_created_at(cls, created_at):
         if created_at > datetime.now():
             raise ValueError("Дата создания не может быть в будущем")
         return created_at
 
-def get_db():
+async def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+@app.on_event("startup")
+async def warm_up_pool():
+    connections = [await engine.connect() for _ in range(2)]
+    for connection in connections:
+        await connection.close()
+
+# Идентификаторы, которые заведомо есть в базе
+EXISTS_TTL_SECONDS = 60
+EXISTS_MAX_ENTRIES = 10000
+_existing_ids = {}
+
+def _known_to_exist(pk):
+    expires = _existing_ids.get(pk)
+    return expires is not None and expires > time.monotonic()
+
+def _remember_existing(pk):
+    if len(_existing_ids) >= EXISTS_MAX_ENTRIES:
+        _existing_ids.clear()
+    _existing_ids[pk] = time.monotonic() + EXISTS_TTL_SECONDS
 
 @app.get("/tasks")
-def get_tasks(
+async def get_tasks(
     task_id: str = None,
-    status: str = None,
-    priority: str = None,
-    db: Session = Depends(get_db)
+    status: TaskStatus = None,
+    priority: TaskPriority = None,
+    fields: str = None,  # Список возвращаемых колонок через запятую
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    after: str = None,  # Keyset-пагинация: вернуть записи с task_id больше указанного
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(TaskDB)
-    if task_id:
-        query = query.filter(TaskDB.task_id == task_id)
-    if status:
-        query = query.filter(TaskDB.status == status)
-    if priority:
-        query = query.filter(TaskDB.priority == priority)
-    return query.all()
+    candidates = [
+        (TaskDB.task_id, task_id),
+        (TaskDB.status, status.value if status else None),
+        (TaskDB.priority, priority.value if priority else None),
+    ]
+    conditions = [column == value for column, value in candidates if value]
+    if after:
+        conditions.append(TaskDB.task_id > after)
+    query = select(TaskDB).options(raiseload("*"))
+    if conditions:
+        query = query.where(and_(*conditions))
+    if fields:
+        names = [name.strip() for name in fields.split(",")]
+        unknown = [name for name in names if name not in TaskDB.__table__.columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(unknown)}")
+        query = query.options(load_only(*[getattr(TaskDB, name) for name in names]))
+    query = query.order_by(TaskDB.task_id).limit(limit).offset(offset)
+    return (await db.scalars(query)).all()
 
 @app.post("/tasks")
-def create_task(task: Task, db: Session = Depends(get_db)):
-    db_task = db.query(TaskDB).filter(TaskDB.task_id == task.task_id).first()
-    if db_task:
+async def create_task(task: Task, db: AsyncSession = Depends(get_db)):
+    if _known_to_exist(task.task_id):
+        raise HTTPException(status_code=400, detail="Задача с таким ID уже существует")
+    stmt = sqlite_insert(TaskDB).values(**task.dict()).on_conflict_do_nothing(index_elements=["task_id"])
+    async with db.begin():
+        result = await db.execute(stmt)
+    _remember_existing(task.task_id)
+    if result.rowcount == 0:
         raise HTTPException(status_code=400, detail="Задача с таким ID уже существует")
-    db_task = TaskDB(**task.dict())
-    db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
     return {"message": "Задача успешно создана"}
 
+@app.post("/tasks/bulk")
+async def create_tasks_bulk(tasks: List[Task], db: AsyncSession = Depends(get_db)):
+    created = 0
+    if tasks:
+        stmt = sqlite_insert(TaskDB).on_conflict_do_nothing(index_elements=["task_id"])
+        async with db.begin():
+            connection = await db.connection()
+            result = await connection.execute(stmt, [task.dict() for task in tasks])
+        for task in tasks:
+            _remember_existing(task.task_id)
+        created = result.rowcount
+    return {"message": f"Создано задач: {created}, пропущено (ID уже существует): {len(tasks) - created}"}
+
 @app.put("/tasks/{task_id}")
-def update_task(task_id: str, task: Task, db: Session = Depends(get_db)):
+async def update_task(task_id: str, task: Task, db: AsyncSession = Depends(get_db)):
     if task_id != task.task_id:
         raise HTTPException(status_code=400, detail="ID задачи в пути и теле запроса не совпадают")
-    db_task = db.query(TaskDB).filter(TaskDB.task_id == task_id).first()
-    if not db_task:
+    result = await db.execute(update(TaskDB).where(TaskDB.task_id == task_id).values(**task.dict()))
+    await db.commit()
+    if result.rowcount == 0:
+        _existing_ids.pop(task_id, None)
         raise HTTPException(status_code=404, detail="Задача не найдена")
-    for key, value in task.dict().items():
-        setattr(db_task, key, value)
-    db.commit()
-    db.refresh(db_task)
     return {"message": "Задача успешно обновлена"}
 
 @app.delete("/tasks/{task_id}")
-def delete_task(task_id: str, db: Session = Depends(get_db)):
-    db_task = db.query(TaskDB).filter(TaskDB.task_id == task_id).first()
-    if not db_task:
+async def delete_task(task_id: str, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(delete(TaskDB).where(TaskDB.task_id == task_id))
+    await db.commit()
+    _existing_ids.pop(task_id, None)
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Задача не найдена")
-    db.delete(db_task)
-    db.commit()
     return {"message": "Задача успешно удалена"}
\ No newline at end of file
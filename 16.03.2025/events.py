@@ -1,16 +1,43 @@
 from enum import Enum as PyEnum
-from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, String, DateTime, Enum as SQLAlchemyEnum
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from typing import List
+import os
+import time
+from fastapi import FastAPI, Depends, Query, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, field_validator
+from sqlalchemy import Column, String, DateTime, Enum as SQLAlchemyEnum, and_, event, update, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, load_only, raiseload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
-DATABASE_URL = "sqlite:///./events.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./events.db")
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=8,
+    max_overflow=16,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    query_cache_size=1200,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-64000")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
 class EventType(str, PyEnum):
@@ -22,12 +49,18 @@ class EventType(str, PyEnum):
 class EventDB(Base):
     __tablename__ = "events"
     event_id = Column(String, primary_key=True, index=True)
-    name = Column(String, nullable=False)
+    name = Column(String, nullable=False, index=True)
     date = Column(DateTime, nullable=False)
-    location = Column(String, nullable=False)
-    event_type = Column(SQLAlchemyEnum(EventType), nullable=False)
+    location = Column(String, nullable=False, index=True)
+    event_type = Column(SQLAlchemyEnum(EventType), nullable=False, index=True)
 
-Base.metadata.create_all(bind=engine)
+@app.on_event("startup")
+async def create_tables():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in EventDB.__table__.indexes:
+            await connection.run_sync(index.create, checkfirst=True)
 
 class Event(BaseModel):
     event_id: str
@@ -36,7 +69,8 @@ class Event(BaseModel):
     location: str
     event_type: EventType
 
-    @validator("event_id")
+    @field_validator("event_id")
+    @classmethod
     def validate_event_id(cls, event_id):
         if not event_id.isalnum():
             raise ValueError("ID события должен состоять только из букв и цифр")
@@ -44,73 +78,157 @@ class Event(BaseModel):
             raise ValueError("ID события должен быть длиной не менее 4 символов")
         return event_id
 
-    @validator("name")
+    @field_validator("name")
+    @classmethod
     def validate_name(cls, name):
         if len(name.strip()) < 3:
             raise ValueError("Название события должно быть длиной не менее 3 символов")
         return name
 
-    @validator("date")
+    @field_validator("date")
+    @classmethod
     def validate_date(cls, date):
         if date < datetime.now():
             raise ValueError("Дата события не может быть в прошлом")
         return date
 
-def get_db():
+async def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+@app.on_event("startup")
+async def warm_up_pool():
+    connections = [await engine.connect() for _ in range(2)]
+    for connection in connections:
+        await connection.close()
+
+# Кэш ответов списочного GET
+CACHE_TTL_SECONDS = 30
+CACHE_MAX_ENTRIES = 1024
+_list_cache = {}
+_cache_generation = 0
+
+def _cache_get(key):
+    entry = _list_cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+def _cache_put(key, value, generation):
+    # Ответ, прочитанный до записи, завершившейся во время запроса, не кэшируется
+    if generation != _cache_generation:
+        return
+    if len(_list_cache) >= CACHE_MAX_ENTRIES:
+        _list_cache.clear()
+    _list_cache[key] = (time.monotonic() + CACHE_TTL_SECONDS, value)
+
+def _invalidate_list_cache():
+    global _cache_generation
+    _cache_generation += 1
+    _list_cache.clear()
+
+# Идентификаторы, которые заведомо есть в базе
+EXISTS_TTL_SECONDS = 60
+EXISTS_MAX_ENTRIES = 10000
+_existing_ids = {}
+
+def _known_to_exist(pk):
+    expires = _existing_ids.get(pk)
+    return expires is not None and expires > time.monotonic()
+
+def _remember_existing(pk):
+    if len(_existing_ids) >= EXISTS_MAX_ENTRIES:
+        _existing_ids.clear()
+    _existing_ids[pk] = time.monotonic() + EXISTS_TTL_SECONDS
 
 @app.get("/events")
-def get_events(
+async def get_events(
     event_id: str = None,
     name: str = None,
     location: str = None,
-    event_type: str = None,
-    db: Session = Depends(get_db)
+    event_type: EventType = None,
+    fields: str = None,  # Список возвращаемых колонок через запятую
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    after: str = None,  # Keyset-пагинация: вернуть записи с event_id больше указанного
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(EventDB)
-    if event_id:
-        query = query.filter(EventDB.event_id == event_id)
-    if name:
-        query = query.filter(EventDB.name == name)
-    if location:
-        query = query.filter(EventDB.location == location)
-    if event_type:
-        query = query.filter(EventDB.event_type == event_type)
-    return query.all()
+    cache_key = (event_id, name, location, event_type, fields, limit, offset, after)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+    generation = _cache_generation
+    candidates = [
+        (EventDB.event_id, event_id),
+        (EventDB.name, name),
+        (EventDB.location, location),
+        (EventDB.event_type, event_type.value if event_type else None),
+    ]
+    conditions = [column == value for column, value in candidates if value]
+    if after:
+        conditions.append(EventDB.event_id > after)
+    query = select(EventDB).options(raiseload("*"))
+    if conditions:
+        query = query.where(and_(*conditions))
+    if fields:
+        names = [name.strip() for name in fields.split(",")]
+        unknown = [name for name in names if name not in EventDB.__table__.columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(unknown)}")
+        query = query.options(load_only(*[getattr(EventDB, name) for name in names]))
+    query = query.order_by(EventDB.event_id).limit(limit).offset(offset)
+    response = jsonable_encoder((await db.scalars(query)).all())
+    _cache_put(cache_key, response, generation)
+    return response
 
 @app.post("/events")
-def create_event(event: Event, db: Session = Depends(get_db)):
-    db_event = db.query(EventDB).filter(EventDB.event_id == event.event_id).first()
-    if db_event:
+async def create_event(event: Event, db: AsyncSession = Depends(get_db)):
+    if _known_to_exist(event.event_id):
+        raise HTTPException(status_code=400, detail="Событие с таким ID уже существует")
+    stmt = sqlite_insert(EventDB).values(**event.dict()).on_conflict_do_nothing(index_elements=["event_id"])
+    async with db.begin():
+        result = await db.execute(stmt)
+    _remember_existing(event.event_id)
+    _invalidate_list_cache()
+    if result.rowcount == 0:
         raise HTTPException(status_code=400, detail="Событие с таким ID уже существует")
-    db_event = EventDB(**event.dict())
-    db.add(db_event)
-    db.commit()
-    db.refresh(db_event)
     return {"message": "Событие успешно создано"}
 
+@app.post("/events/bulk")
+async def create_events_bulk(events: List[Event], db: AsyncSession = Depends(get_db)):
+    created = 0
+    if events:
+        stmt = sqlite_insert(EventDB).on_conflict_do_nothing(index_elements=["event_id"])
+        async with db.begin():
+            connection = await db.connection()
+            result = await connection.execute(stmt, [item.dict() for item in events])
+        for item in events:
+            _remember_existing(item.event_id)
+        _invalidate_list_cache()
+        created = result.rowcount
+    return {"message": f"Создано событий: {created}, пропущено (ID уже существует): {len(events) - created}"}
+
 @app.put("/events/{event_id}")
-def update_event(event_id: str, event: Event, db: Session = Depends(get_db)):
+async def update_event(event_id: str, event: Event, db: AsyncSession = Depends(get_db)):
     if event_id != event.event_id:
         raise HTTPException(status_code=400, detail="ID события в пути и теле запроса не совпадают")
-    db_event = db.query(EventDB).filter(EventDB.event_id == event_id).first()
-    if not db_event:
+    result = await db.execute(update(EventDB).where(EventDB.event_id == event_id).values(**event.dict()))
+    await db.commit()
+    _invalidate_list_cache()
+    if result.rowcount == 0:
+        _existing_ids.pop(event_id, None)
         raise HTTPException(status_code=404, detail="Событие не найдено")
-    for key, value in event.dict().items():
-        setattr(db_event, key, value)
-    db.commit()
-    db.refresh(db_event)
     return {"message": "Событие успешно обновлено"}
 
 @app.delete("/events/{event_id}")
-def delete_event(event_id: str, db: Session = Depends(get_db)):
-    db_event = db.query(EventDB).filter(EventDB.event_id == event_id).first()
-    if not db_event:
+async def delete_event(event_id: str, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(delete(EventDB).where(EventDB.event_id == event_id))
+    await db.commit()
+    _existing_ids.pop(event_id, None)
+    _invalidate_list_cache()
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Событие не найдено")
-    db.delete(db_event)
-    db.commit()
     return {"message": "Событие успешно удалено"}
\ No newline at end of file
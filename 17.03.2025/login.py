@@ -1,17 +1,45 @@
 from enum import Enum as PyEnum
-from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, String, Integer, DateTime, Enum as SQLAlchemyEnum
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from datetime import datetime
+from typing import List
+import os
+import time
+from fastapi import FastAPI, Depends, Query, HTTPException
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field, field_validator
+from sqlalchemy import Column, String, Integer, Enum as SQLAlchemyEnum, Index, and_, event, update, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, load_only, raiseload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import re  
 
-app = FastAPI()  # Исправлено: скобки после FastAPI
+# Шаблон пароля с lookahead не поддерживается pattern в pydantic-core, поэтому проверяется через re
+_PASSWORD_RE = re.compile(r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*#?&])[A-Za-z\d@$!%*#?&]{8,}$')
 
-DATABASE_URL = "sqlite:///./logins.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+app = FastAPI(default_response_class=ORJSONResponse)  # Исправлено: скобки после FastAPI
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./logins.db")
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=8,
+    max_overflow=16,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    query_cache_size=1200,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-64000")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
 class GenderType(str, PyEnum):
@@ -19,123 +47,182 @@ class GenderType(str, PyEnum):
     WOMEN = "WOMEN"
 
 class UserDB(Base):
-    __tablename__ = "Users"
+    __tablename__ = "auth_users"  # "Users" совпадал с таблицей users из inn.py (SQLite не различает регистр)
+    __table_args__ = (Index("ix_auth_users_first_name_last_name", "first_name", "last_name"),)
     mail_ID = Column(String, primary_key=True, index=True)
     password = Column(String, nullable=False)
     first_name = Column(String, nullable=False)
-    last_name = Column(String, nullable=False)
+    last_name = Column(String, nullable=False, index=True)
     patronymic = Column(String, nullable=False)
-    gender = Column(SQLAlchemyEnum(GenderType), nullable=False)
+    gender = Column(SQLAlchemyEnum(GenderType), nullable=False, index=True)
     age = Column(Integer, nullable=False)
 
-Base.metadata.create_all(bind=engine)
+# Таблица раньше называлась "Users": переименовываем её с данными, старые индексы заменяются новыми
+async def _rename_legacy_table(connection):
+    tables = {row[0].lower() for row in await connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "auth_users" in tables or "users" not in tables:
+        return
+    columns = {row[1] for row in await connection.exec_driver_sql('PRAGMA table_info("Users")')}
+    if "mail_ID" not in columns:  # Это таблица users из inn.py в общем файле
+        return
+    indexes = await connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'Users' COLLATE NOCASE AND sql IS NOT NULL"
+    )
+    for (name,) in indexes.all():
+        await connection.exec_driver_sql(f'DROP INDEX "{name}"')
+    await connection.exec_driver_sql('ALTER TABLE "Users" RENAME TO auth_users')
+
+@app.on_event("startup")
+async def create_tables():
+    async with engine.begin() as connection:
+        await _rename_legacy_table(connection)
+        await connection.run_sync(Base.metadata.create_all)
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in UserDB.__table__.indexes:
+            await connection.run_sync(index.create, checkfirst=True)
 
 class User(BaseModel):
-    mail_ID: str
+    mail_ID: str = Field(pattern=r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
     password: str
     first_name: str
     last_name: str
     patronymic: str
     gender: GenderType
-    age: int
+    age: int = Field(ge=18)
 
 
-    @validator("age")
-    def validator_age(cls, age):
-        if age < 18:
-            raise ValueError("Ваш возраст не соответствует минимальному, минимальный возраст 18 лет")
-        return age
-    
-    @validator("password")
+    @field_validator("password")
+    @classmethod
     def validator_password(cls, password):
-        pattern = r'^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*#?&])[A-Za-z\d@$!%*#?&]{8,}$'
-        if not re.match(pattern, password):
+        if not _PASSWORD_RE.match(password):
             raise ValueError(
                 "Пароль должен содержать минимум 8 символов, "
                 "включая хотя бы одну заглавную букву, одну строчную букву, одну цифру и один спецсимвол (@$!%*#?&)"
             )
         return password
     
-    @validator("mail_ID")
-    def validator_mail(cls, mail_ID):
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(pattern, mail_ID):
-            raise ValueError("Неверный формат email. Пример: user@example.com")
-        return mail_ID
-    
-    @validator("first_name")
+    @field_validator("first_name")
+    @classmethod
     def validator_first_name(cls, first_name):
         if len(first_name.strip()) < 2:
             raise ValueError("Имя должно содержать минимум 2 символа")
         return first_name
     
-    @validator("last_name")
+    @field_validator("last_name")
+    @classmethod
     def validator_last_name(cls, last_name):
         if len(last_name.strip()) < 2:
             raise ValueError("Фамилия должна содержать минимум 2 символа")
         return last_name
     
-    @validator("patronymic")
+    @field_validator("patronymic")
+    @classmethod
     def validator_patronymic(cls, patronymic):
         if len(patronymic.strip()) < 2:
             raise ValueError("Отчество должно содержать минимум 2 символа")
         return patronymic
 
-def get_db():
+async def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+@app.on_event("startup")
+async def warm_up_pool():
+    connections = [await engine.connect() for _ in range(2)]
+    for connection in connections:
+        await connection.close()
+
+# Идентификаторы, которые заведомо есть в базе
+EXISTS_TTL_SECONDS = 60
+EXISTS_MAX_ENTRIES = 10000
+_existing_ids = {}
+
+def _known_to_exist(pk):
+    expires = _existing_ids.get(pk)
+    return expires is not None and expires > time.monotonic()
+
+def _remember_existing(pk):
+    if len(_existing_ids) >= EXISTS_MAX_ENTRIES:
+        _existing_ids.clear()
+    _existing_ids[pk] = time.monotonic() + EXISTS_TTL_SECONDS
 
 @app.get("/users")
-def get_users(
+async def get_users(
     mail_ID: str = None,
     first_name: str = None,
     last_name: str = None,
     gender: GenderType = None,
-    db: Session = Depends(get_db)
+    fields: str = None,  # Список возвращаемых колонок через запятую
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    after: str = None,  # Keyset-пагинация: вернуть записи с mail_ID больше указанного
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(UserDB)
-    if mail_ID:
-        query = query.filter(UserDB.mail_ID == mail_ID)
-    if first_name:
-        query = query.filter(UserDB.first_name == first_name)
-    if last_name:
-        query = query.filter(UserDB.last_name == last_name)
-    if gender:
-        query = query.filter(UserDB.gender == gender)
-    return query.all()
+    candidates = [
+        (UserDB.mail_ID, mail_ID),
+        (UserDB.first_name, first_name),
+        (UserDB.last_name, last_name),
+        (UserDB.gender, gender.value if gender else None),
+    ]
+    conditions = [column == value for column, value in candidates if value]
+    if after:
+        conditions.append(UserDB.mail_ID > after)
+    query = select(UserDB).options(raiseload("*"))
+    if conditions:
+        query = query.where(and_(*conditions))
+    if fields:
+        names = [name.strip() for name in fields.split(",")]
+        unknown = [name for name in names if name not in UserDB.__table__.columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(unknown)}")
+        query = query.options(load_only(*[getattr(UserDB, name) for name in names]))
+    query = query.order_by(UserDB.mail_ID).limit(limit).offset(offset)
+    return (await db.scalars(query)).all()
 
 @app.post("/users")
-def create_user(user: User, db: Session = Depends(get_db)):
-    db_user = db.query(UserDB).filter(UserDB.mail_ID == user.mail_ID).first()
-    if db_user:
+async def create_user(user: User, db: AsyncSession = Depends(get_db)):
+    if _known_to_exist(user.mail_ID):
+        raise HTTPException(status_code=400, detail="Пользователь с таким email уже существует")
+    stmt = sqlite_insert(UserDB).values(**user.dict()).on_conflict_do_nothing(index_elements=["mail_ID"])
+    async with db.begin():
+        result = await db.execute(stmt)
+    _remember_existing(user.mail_ID)
+    if result.rowcount == 0:
         raise HTTPException(status_code=400, detail="Пользователь с таким email уже существует")
-    db_user = UserDB(**user.dict())
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
     return {"message": "Пользователь успешно создан"}
 
+@app.post("/users/bulk")
+async def create_users_bulk(users: List[User], db: AsyncSession = Depends(get_db)):
+    created = 0
+    if users:
+        stmt = sqlite_insert(UserDB).on_conflict_do_nothing(index_elements=["mail_ID"])
+        async with db.begin():
+            connection = await db.connection()
+            result = await connection.execute(stmt, [user.dict() for user in users])
+        for user in users:
+            _remember_existing(user.mail_ID)
+        created = result.rowcount
+    return {"message": f"Создано пользователей: {created}, пропущено (email уже существует): {len(users) - created}"}
+
 @app.put("/users/{mail_ID}")
-def update_user(mail_ID: str, user: User, db: Session = Depends(get_db)):
+async def update_user(mail_ID: str, user: User, db: AsyncSession = Depends(get_db)):
     if mail_ID != user.mail_ID:
         raise HTTPException(status_code=400, detail="Email в пути и теле запроса не совпадают")
-    db_user = db.query(UserDB).filter(UserDB.mail_ID == mail_ID).first()
-    if not db_user:
+    result = await db.execute(update(UserDB).where(UserDB.mail_ID == mail_ID).values(**user.dict()))
+    await db.commit()
+    if result.rowcount == 0:
+        _existing_ids.pop(mail_ID, None)
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    for key, value in user.dict().items():
-        setattr(db_user, key, value)
-    db.commit()
-    db.refresh(db_user)
     return {"message": "Пользователь успешно обновлен"}
 
 @app.delete("/users/{mail_ID}")
-def delete_user(mail_ID: str, db: Session = Depends(get_db)):
-    db_user = db.query(UserDB).filter(UserDB.mail_ID == mail_ID).first()
-    if not db_user:
+async def delete_user(mail_ID: str, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(delete(UserDB).where(UserDB.mail_ID == mail_ID))
+    await db.commit()
+    _existing_ids.pop(mail_ID, None)
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-    db.delete(db_user)
-    db.commit()
     return {"message": "Пользователь успешно удален"}
\ No newline at end of file
@@ -1,17 +1,46 @@
 from enum import Enum as PyEnum
-from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, String, Float, Integer, Enum as SQLAlchemyEnum
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from datetime import datetime
+from typing import List
+import os
+import time
+from fastapi import FastAPI, Depends, Query, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field, field_validator
+from sqlalchemy import Column, String, Float, Integer, Enum as SQLAlchemyEnum, and_, event, update, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base, load_only, raiseload
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import re  
 
-app = FastAPI()
+_LETTER_RE = re.compile(r'[A-Za-z]')
+_DIGIT_RE = re.compile(r'\d')
 
-DATABASE_URL = "sqlite:///./minerals.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+app = FastAPI(default_response_class=ORJSONResponse)
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./minerals.db")
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=8,
+    max_overflow=16,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    query_cache_size=1200,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-64000")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 Base = declarative_base()
 
 class RarityType(str, PyEnum):
@@ -23,136 +52,205 @@ class RarityType(str, PyEnum):
 class MineralDB(Base):
     __tablename__ = "minerals"
     catalog_id = Column(String, primary_key=True, index=True)
-    name = Column(String, nullable=False)
+    name = Column(String, nullable=False, index=True)
     chemical_formula = Column(String, nullable=False)
     hardness = Column(Float, nullable=False)
     weight_carats = Column(Float, nullable=False)
-    rarity = Column(SQLAlchemyEnum(RarityType), nullable=False)
-    origin_country = Column(String, nullable=False)
+    rarity = Column(SQLAlchemyEnum(RarityType), nullable=False, index=True)
+    origin_country = Column(String, nullable=False, index=True)
     specimens_count = Column(Integer, nullable=False)
 
-Base.metadata.create_all(bind=engine)
+@app.on_event("startup")
+async def create_tables():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in MineralDB.__table__.indexes:
+            await connection.run_sync(index.create, checkfirst=True)
 
 class Mineral(BaseModel):
-    catalog_id: str
+    catalog_id: str = Field(pattern=r'^[A-Z]{2}-[0-9]{4}$')  # Формат XX-1234
     name: str
     chemical_formula: str
-    hardness: float
-    weight_carats: float
+    hardness: float = Field(ge=1.0, le=10.0)  # Шкала Мооса
+    weight_carats: float = Field(gt=0)
     rarity: RarityType
     origin_country: str
-    specimens_count: int
+    specimens_count: int = Field(ge=0)
 
-    @validator("catalog_id")
-    def validator_catalog_id(cls, catalog_id):
-        pattern = r'^[A-Z]{2}-\d{4}$'
-        if not re.match(pattern, catalog_id):
-            raise ValueError("ID каталога должен иметь формат XX-1234 (две буквы, дефис, четыре цифры)")
-        return catalog_id
-
-    @validator("name")
+    @field_validator("name")
+    @classmethod
     def validator_name(cls, name):
         if len(name.strip()) < 3:
             raise ValueError("Название минерала должно содержать минимум 3 символа")
         return name
     
-    @validator("chemical_formula")
+    @field_validator("chemical_formula")
+    @classmethod
     def validator_formula(cls, chemical_formula):
-        if not re.search(r'[A-Za-z]', chemical_formula) or not re.search(r'\d', chemical_formula):
+        if not _LETTER_RE.search(chemical_formula) or not _DIGIT_RE.search(chemical_formula):
             raise ValueError("Химическая формула должна содержать буквы и цифры")
         return chemical_formula
     
-    @validator("hardness")
-    def validator_hardness(cls, hardness):
-        if hardness < 1.0 or hardness > 10.0:
-            raise ValueError("Твердость по шкале Мооса должна быть от 1 до 10")
-        return hardness
-    
-    @validator("weight_carats")
-    def validator_weight(cls, weight_carats):
-        if weight_carats <= 0:
-            raise ValueError("Вес в каратах должен быть положительным числом")
-        return weight_carats
-    
-    @validator("origin_country")
+    @field_validator("origin_country")
+    @classmethod
     def validator_country(cls, origin_country):
         if len(origin_country.strip()) < 2:
             raise ValueError("Название страны должно содержать минимум 2 символа")
         return origin_country
-    
-    @validator("specimens_count")
-    def validator_count(cls, specimens_count):
-        if specimens_count < 0:
-            raise ValueError("Количество образцов не может быть отрицательным")
-        return specimens_count
 
-def get_db():
+async def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+@app.on_event("startup")
+async def warm_up_pool():
+    connections = [await engine.connect() for _ in range(2)]
+    for connection in connections:
+        await connection.close()
+
+# Кэш ответов списочного GET
+CACHE_TTL_SECONDS = 30
+CACHE_MAX_ENTRIES = 1024
+_list_cache = {}
+_cache_generation = 0
+
+def _cache_get(key):
+    entry = _list_cache.get(key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+def _cache_put(key, value, generation):
+    # Ответ, прочитанный до записи, завершившейся во время запроса, не кэшируется
+    if generation != _cache_generation:
+        return
+    if len(_list_cache) >= CACHE_MAX_ENTRIES:
+        _list_cache.clear()
+    _list_cache[key] = (time.monotonic() + CACHE_TTL_SECONDS, value)
+
+def _invalidate_list_cache():
+    global _cache_generation
+    _cache_generation += 1
+    _list_cache.clear()
+
+# Идентификаторы, которые заведомо есть в базе
+EXISTS_TTL_SECONDS = 60
+EXISTS_MAX_ENTRIES = 10000
+_existing_ids = {}
+
+def _known_to_exist(pk):
+    expires = _existing_ids.get(pk)
+    return expires is not None and expires > time.monotonic()
+
+def _remember_existing(pk):
+    if len(_existing_ids) >= EXISTS_MAX_ENTRIES:
+        _existing_ids.clear()
+    _existing_ids[pk] = time.monotonic() + EXISTS_TTL_SECONDS
 
 @app.get("/minerals")
-def get_minerals(
+async def get_minerals(
     catalog_id: str = None,
     name: str = None,
     rarity: RarityType = None,
     origin_country: str = None,
-    db: Session = Depends(get_db)
+    fields: str = None,  # Список возвращаемых колонок через запятую
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    after: str = None,  # Keyset-пагинация: вернуть записи с catalog_id больше указанного
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(MineralDB)
-    if catalog_id:
-        query = query.filter(MineralDB.catalog_id == catalog_id)
-    if name:
-        query = query.filter(MineralDB.name == name)
-    if rarity:
-        query = query.filter(MineralDB.rarity == rarity)
-    if origin_country:
-        query = query.filter(MineralDB.origin_country == origin_country)
-    results = query.all()
-    return {
+    cache_key = (catalog_id, name, rarity, origin_country, fields, limit, offset, after)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+    generation = _cache_generation
+    candidates = [
+        (MineralDB.catalog_id, catalog_id),
+        (MineralDB.name, name),
+        (MineralDB.rarity, rarity.value if rarity else None),
+        (MineralDB.origin_country, origin_country),
+    ]
+    conditions = [column == value for column, value in candidates if value]
+    if after:
+        conditions.append(MineralDB.catalog_id > after)
+    query = select(MineralDB).options(raiseload("*"))
+    if conditions:
+        query = query.where(and_(*conditions))
+    if fields:
+        names = [name.strip() for name in fields.split(",")]
+        unknown = [name for name in names if name not in MineralDB.__table__.columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(unknown)}")
+        query = query.options(load_only(*[getattr(MineralDB, name) for name in names]))
+    query = query.order_by(MineralDB.catalog_id).limit(limit).offset(offset)
+    results = (await db.scalars(query)).all()
+    response = jsonable_encoder({
         "message": f"Найдено {len(results)} минералов",
         "data": results
-    }
+    })
+    _cache_put(cache_key, response, generation)
+    return response
 
 @app.post("/minerals")
-def create_mineral(mineral: Mineral, db: Session = Depends(get_db)):
-    db_mineral = db.query(MineralDB).filter(MineralDB.catalog_id == mineral.catalog_id).first()
-    if db_mineral:
+async def create_mineral(mineral: Mineral, db: AsyncSession = Depends(get_db)):
+    if _known_to_exist(mineral.catalog_id):
+        raise HTTPException(status_code=400, detail="Минерал с таким ID каталога уже существует")
+    stmt = sqlite_insert(MineralDB).values(**mineral.dict()).on_conflict_do_nothing(index_elements=["catalog_id"])
+    async with db.begin():
+        result = await db.execute(stmt)
+    _remember_existing(mineral.catalog_id)
+    _invalidate_list_cache()
+    if result.rowcount == 0:
         raise HTTPException(status_code=400, detail="Минерал с таким ID каталога уже существует")
-    db_mineral = MineralDB(**mineral.dict())
-    db.add(db_mineral)
-    db.commit()
-    db.refresh(db_mineral)
     return {
         "message": "Минерал успешно добавлен в коллекцию",
         "data": mineral
     }
 
+@app.post("/minerals/bulk")
+async def create_minerals_bulk(minerals: List[Mineral], db: AsyncSession = Depends(get_db)):
+    created = 0
+    if minerals:
+        stmt = sqlite_insert(MineralDB).on_conflict_do_nothing(index_elements=["catalog_id"])
+        async with db.begin():
+            connection = await db.connection()
+            result = await connection.execute(stmt, [mineral.dict() for mineral in minerals])
+        for mineral in minerals:
+            _remember_existing(mineral.catalog_id)
+        _invalidate_list_cache()
+        created = result.rowcount
+    return {
+        "message": f"Добавлено минералов: {created}, пропущено (ID каталога уже существует): {len(minerals) - created}",
+        "data": {"created": created, "skipped": len(minerals) - created}
+    }
+
 @app.put("/minerals/{catalog_id}")
-def update_mineral(catalog_id: str, mineral: Mineral, db: Session = Depends(get_db)):
+async def update_mineral(catalog_id: str, mineral: Mineral, db: AsyncSession = Depends(get_db)):
     if catalog_id != mineral.catalog_id:
         raise HTTPException(status_code=400, detail="ID каталога в пути и теле запроса не совпадают")
-    db_mineral = db.query(MineralDB).filter(MineralDB.catalog_id == catalog_id).first()
-    if not db_mineral:
+    result = await db.execute(update(MineralDB).where(MineralDB.catalog_id == catalog_id).values(**mineral.dict()))
+    await db.commit()
+    _invalidate_list_cache()
+    if result.rowcount == 0:
+        _existing_ids.pop(catalog_id, None)
         raise HTTPException(status_code=404, detail="Минерал не найден")
-    for key, value in mineral.dict().items():
-        setattr(db_mineral, key, value)
-    db.commit()
-    db.refresh(db_mineral)
     return {
         "message": "Информация о минерале успешно обновлена",
         "data": mineral
     }
 
 @app.delete("/minerals/{catalog_id}")
-def delete_mineral(catalog_id: str, db: Session = Depends(get_db)):
-    db_mineral = db.query(MineralDB).filter(MineralDB.catalog_id == catalog_id).first()
-    if not db_mineral:
+async def delete_mineral(catalog_id: str, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(delete(MineralDB).where(MineralDB.catalog_id == catalog_id))
+    await db.commit()
+    _existing_ids.pop(catalog_id, None)
+    _invalidate_list_cache()
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Минерал не найден")
-    db.delete(db_mineral)
-    db.commit()
     return {
         "message": "Минерал успешно удален из коллекции",
         "data": {"catalog_id": catalog_id}
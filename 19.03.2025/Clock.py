@@ -1,16 +1,58 @@
 from enum import Enum as PyEnum
-from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, String, Integer, Enum as SQLAlchemyEnum
+from typing import Annotated, List
+from fastapi import FastAPI, Depends, Query, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, validator
+from sqlalchemy import Column, String, Integer, Index, event, func, lambda_stmt, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-import re  
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import os
+import time
+import orjson
 
-app = FastAPI()
+# Форматы идентификаторов
+SerialNumber = Annotated[str, Field(pattern=r'^[A-Z0-9]{6,12}$')]
 
-DATABASE_URL = "sqlite:///./antique_clocks.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+app = FastAPI(default_response_class=ORJSONResponse)
+
+DATABASE_URL = "sqlite+aiosqlite:///./antique_clocks.db"
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=8,
+    max_overflow=16,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-65536")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+# Периодически обновляет статистику планировщика, когда соединение возвращается в пул
+OPTIMIZE_INTERVAL_SECONDS = 3600
+_last_optimize = -OPTIMIZE_INTERVAL_SECONDS
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _optimize_on_checkin(dbapi_conn, _):
+    global _last_optimize
+    if dbapi_conn is None or time.monotonic() - _last_optimize < OPTIMIZE_INTERVAL_SECONDS:
+        return
+    _last_optimize = time.monotonic()
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA optimize")
+    cur.close()
+
+SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 class MechanismType(str, PyEnum):
@@ -21,34 +63,37 @@ class MechanismType(str, PyEnum):
 
 class ClockDB(Base):
     __tablename__ = "clocks"
+    __table_args__ = (Index("ix_clocks_brand_mechanism", "brand", "mechanism"),)
     serial_number = Column(String, primary_key=True, index=True)
     brand = Column(String, nullable=False)
     model = Column(String, nullable=False)
     manufacture_year = Column(Integer, nullable=False)
-    mechanism = Column(SQLAlchemyEnum(MechanismType), nullable=False)
+    mechanism = Column(String, nullable=False, index=True)  # Значение MechanismType хранится строкой, проверку выполняет Pydantic
     material = Column(String, nullable=False)
     condition_grade = Column(Integer, nullable=False)  # Оценка состояния от 1 до 10
 
-Base.metadata.create_all(bind=engine)
+async def init_db():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in ClockDB.__table__.indexes:
+            await connection.run_sync(index.create, checkfirst=True)
+        await connection.exec_driver_sql("ANALYZE")
+
+# При запуске через __main__ схема создаётся один раз до старта воркеров, а не в каждом из них
+@app.on_event("startup")
+async def create_tables():
+    if os.getenv("CLOCKS_DB_READY") != "1":
+        await init_db()
 
 class Clock(BaseModel):
-    serial_number: str
+    serial_number: SerialNumber
     brand: str
     model: str
-    manufacture_year: int
+    manufacture_year: int = Field(ge=1600, le=2025)  # Текущий год зафиксирован для примера
     mechanism: MechanismType
     material: str
-    condition_grade: int
-
-    class Config:
-        orm_mode = True  # Поддержка преобразования из SQLAlchemy объектов
-
-    @validator("serial_number")
-    def validator_serial_number(cls, serial_number):
-        pattern = r'^[A-Z0-9]{6,12}$'
-        if not re.match(pattern, serial_number):
-            raise ValueError("Серийный номер должен содержать от 6 до 12 букв и цифр")
-        return serial_number
+    condition_grade: int = Field(ge=1, le=10)
 
     @validator("brand")
     def validator_brand(cls, brand):
@@ -62,91 +107,129 @@ class Clock(BaseModel):
             raise ValueError("Модель должна содержать минимум 2 символа")
         return model
     
-    @validator("manufacture_year")
-    def validator_year(cls, manufacture_year):
-        current_year = 2025  # Фиксируем текущий год для примера
-        if manufacture_year < 1600 or manufacture_year > current_year:
-            raise ValueError(f"Год изготовления должен быть между 1600 и {current_year}")
-        return manufacture_year
-    
     @validator("material")
     def validator_material(cls, material):
         if len(material.strip()) < 3:
             raise ValueError("Материал должен содержать минимум 3 символа")
         return material
-    
-    @validator("condition_grade")
-    def validator_condition(cls, condition_grade):
-        if condition_grade < 1 or condition_grade > 10:
-            raise ValueError("Оценка состояния должна быть от 1 до 10")
-        return condition_grade
 
-def get_db():
+async def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+@app.on_event("startup")
+async def warm_up_pool():
+    connections = [await engine.connect() for _ in range(2)]
+    for connection in connections:
+        await connection.close()
 
 @app.get("/clocks")
-def get_clocks(
+async def get_clocks(
     serial_number: str = None,
     brand: str = None,
     mechanism: MechanismType = None,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(ClockDB)
-    if serial_number:
-        query = query.filter(ClockDB.serial_number == serial_number)
-    if brand:
-        query = query.filter(ClockDB.brand == brand)
-    if mechanism:
-        query = query.filter(ClockDB.mechanism == mechanism)
-    results = query.all()
-    results_dict = [Clock.from_orm(r).dict() for r in results]
-    return {
-        "message": f"Найдено {len(results)} часов",
-        "data": results_dict
-    }
+    def apply_filters(stmt):
+        if serial_number:
+            stmt += lambda s: s.where(ClockDB.serial_number == serial_number)
+        if brand:
+            stmt += lambda s: s.where(ClockDB.brand == brand)
+        if mechanism:
+            stmt += lambda s: s.where(ClockDB.mechanism == mechanism)
+        return stmt
+
+    total = await db.scalar(apply_filters(lambda_stmt(lambda: select(func.count()).select_from(ClockDB.__table__))))
+    query = apply_filters(lambda_stmt(lambda: select(ClockDB.__table__)))
+    query += lambda s: s.order_by(ClockDB.serial_number).limit(limit).offset(offset)
+    # "count" — число строк на этой странице
+    result = await db.stream(query, execution_options={"yield_per": 1000})
+
+    async def generate():
+        count = 0
+        yield b'{"message":' + orjson.dumps(f"Найдено {total} часов") + b',"total":%d,"data":[' % total
+        async for rows in result.partitions():
+            chunk = b",".join(orjson.dumps(row._asdict()) for row in rows)
+            yield chunk if count == 0 else b"," + chunk
+            count += len(rows)
+        yield b'],"count":%d}' % count
+
+    return StreamingResponse(generate(), media_type="application/json")
 
 @app.post("/clocks")
-def create_clock(clock: Clock, db: Session = Depends(get_db)):
-    db_clock = db.query(ClockDB).filter(ClockDB.serial_number == clock.serial_number).first()
-    if db_clock:
+async def create_clock(clock: Clock, db: AsyncSession = Depends(get_db)):
+    payload = clock.dict()
+    stmt = sqlite_insert(ClockDB).values(**payload).on_conflict_do_nothing(index_elements=["serial_number"])
+    result = await db.execute(stmt)
+    await db.commit()
+    if result.rowcount == 0:
         raise HTTPException(status_code=400, detail="Часы с таким серийным номером уже существуют")
-    db_clock = ClockDB(**clock.dict())
-    db.add(db_clock)
-    db.commit()
-    db.refresh(db_clock)
     return {
         "message": "Часы успешно добавлены в коллекцию",
-        "data": Clock.from_orm(db_clock).dict()
+        "data": payload
+    }
+
+@app.post("/clocks/bulk")
+async def create_clocks_bulk(clocks: List[Clock], db: AsyncSession = Depends(get_db)):
+    created = 0
+    if clocks:
+        stmt = sqlite_insert(ClockDB).on_conflict_do_nothing(index_elements=["serial_number"])
+        connection = await db.connection()
+        result = await connection.execute(stmt, [clock.dict() for clock in clocks])
+        await db.commit()
+        created = result.rowcount
+    return {
+        "message": f"Добавлено часов: {created}, пропущено (серийный номер уже существует): {len(clocks) - created}",
+        "data": {"created": created, "skipped": len(clocks) - created}
     }
 
 @app.put("/clocks/{serial_number}")
-def update_clock(serial_number: str, clock: Clock, db: Session = Depends(get_db)):
+async def update_clock(serial_number: str, clock: Clock, db: AsyncSession = Depends(get_db)):
     if serial_number != clock.serial_number:
         raise HTTPException(status_code=400, detail="Серийный номер в пути и теле запроса не совпадают")
-    db_clock = db.query(ClockDB).filter(ClockDB.serial_number == serial_number).first()
-    if not db_clock:
+    payload = clock.dict()
+    result = await db.execute(update(ClockDB).where(ClockDB.serial_number == serial_number).values(**payload))
+    await db.commit()
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Часы не найдены")
-    for key, value in clock.dict().items():
-        setattr(db_clock, key, value)
-    db.commit()
-    db.refresh(db_clock)
     return {
         "message": "Информация о часах успешно обновлена",
-        "data": Clock.from_orm(db_clock).dict()
+        "data": payload
     }
 
 @app.delete("/clocks/{serial_number}")
-def delete_clock(serial_number: str, db: Session = Depends(get_db)):
-    db_clock = db.query(ClockDB).filter(ClockDB.serial_number == serial_number).first()
+async def delete_clock(serial_number: str, db: AsyncSession = Depends(get_db)):
+    db_clock = (await db.scalars(select(ClockDB).filter(ClockDB.serial_number == serial_number))).first()
     if not db_clock:
         raise HTTPException(status_code=404, detail="Часы не найдены")
-    db.delete(db_clock)
-    db.commit()
+    await db.delete(db_clock)
+    await db.commit()
     return {
         "message": "Часы успешно удалены из коллекции",
         "data": {"serial_number": serial_number}
     }
+
+async def _prepare_db():
+    await init_db()
+    await engine.dispose()
+
+# Запуск: python Clock.py. Переменные окружения: HOST, PORT, WEB_CONCURRENCY (по умолчанию — число ядер)
+if __name__ == "__main__":
+    import asyncio
+    import uvicorn
+
+    asyncio.run(_prepare_db())
+    os.environ["CLOCKS_DB_READY"] = "1"
+    uvicorn.run(
+        "Clock:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8000")),
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        loop="auto",
+        http="auto",
+    )
@@ -1,17 +1,60 @@
 from enum import Enum as PyEnum
-from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, String, DateTime, Enum as SQLAlchemyEnum
+from functools import lru_cache
+from typing import Annotated, List
+from fastapi import FastAPI, Depends, Query, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, validator
+from sqlalchemy import Column, String, Integer, DateTime, Index, event, func, lambda_stmt, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
-import re  
+import os
+import time
+import orjson
 
-app = FastAPI()
+# Форматы идентификаторов
+MissionCode = Annotated[str, Field(pattern=r'^[A-Z]{2}-\d{4}-[A-Z]$')]
 
-DATABASE_URL = "sqlite:///./space_missions.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+app = FastAPI(default_response_class=ORJSONResponse)
+
+DATABASE_URL = "sqlite+aiosqlite:///./space_missions.db"
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=8,
+    max_overflow=16,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-65536")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+# Периодически обновляет статистику планировщика, когда соединение возвращается в пул
+OPTIMIZE_INTERVAL_SECONDS = 3600
+_last_optimize = -OPTIMIZE_INTERVAL_SECONDS
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _optimize_on_checkin(dbapi_conn, _):
+    global _last_optimize
+    if dbapi_conn is None or time.monotonic() - _last_optimize < OPTIMIZE_INTERVAL_SECONDS:
+        return
+    _last_optimize = time.monotonic()
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA optimize")
+    cur.close()
+
+SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 class MissionType(str, PyEnum):
@@ -22,31 +65,45 @@ class MissionType(str, PyEnum):
 
 class MissionDB(Base):
     __tablename__ = "missions"
+    __table_args__ = (Index("ix_missions_mission_type_launch_site", "mission_type", "launch_site"),)
     mission_code = Column(String, primary_key=True, index=True)
     mission_name = Column(String, nullable=False)
-    launch_site = Column(String, nullable=False)
+    launch_site = Column(String, nullable=False, index=True)
     launch_date = Column(DateTime, nullable=False)
-    mission_type = Column(SQLAlchemyEnum(MissionType), nullable=False)
+    mission_type = Column(String, nullable=False)  # Значение MissionType хранится строкой, проверку выполняет Pydantic
     spacecraft = Column(String, nullable=False)
     crew_size = Column(Integer, nullable=False)
 
-Base.metadata.create_all(bind=engine)
+async def init_db():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in MissionDB.__table__.indexes:
+            await connection.run_sync(index.create, checkfirst=True)
+        await connection.exec_driver_sql("ANALYZE")
+
+# При запуске через __main__ схема создаётся один раз до старта воркеров, а не в каждом из них
+@app.on_event("startup")
+async def create_tables():
+    if os.getenv("MISSIONS_DB_READY") != "1":
+        await init_db()
+
+# Текущее время с точностью до секунды
+@lru_cache(maxsize=1)
+def _cached_now(bucket):
+    return datetime.now()
+
+def _now():
+    return _cached_now(int(time.monotonic()))
 
 class Mission(BaseModel):
-    mission_code: str
+    mission_code: MissionCode
     mission_name: str
     launch_site: str
     launch_date: datetime
     mission_type: MissionType
     spacecraft: str
-    crew_size: int
-
-    @validator("mission_code")
-    def validator_mission_code(cls, mission_code):
-        pattern = r'^[A-Z]{2}-\d{4}-[A-Z]$'
-        if not re.match(pattern, mission_code):
-            raise ValueError("Код миссии должен иметь формат XX-YYYY-Z (две буквы, дефис, четыре цифры, дефис, буква)")
-        return mission_code
+    crew_size: int = Field(ge=0)
 
     @validator("mission_name")
     def validator_mission_name(cls, mission_name):
@@ -62,7 +119,7 @@ class Mission(BaseModel):
     
     @validator("launch_date")
     def validator_launch_date(cls, launch_date):
-        current_date = datetime.now()
+        current_date = _now()
         if launch_date < current_date:
             raise ValueError("Дата запуска не может быть в прошлом")
         return launch_date
@@ -72,88 +129,124 @@ class Mission(BaseModel):
         if len(spacecraft.strip()) < 3:
             raise ValueError("Название космического корабля должно содержать минимум 3 символа")
         return spacecraft
-    
-    @validator("crew_size")
-    def validator_crew_size(cls, crew_size):
-        if crew_size < 0:
-            raise ValueError("Размер экипажа не может быть отрицательным")
-        return crew_size
 
-def get_db():
+async def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+@app.on_event("startup")
+async def warm_up_pool():
+    connections = [await engine.connect() for _ in range(2)]
+    for connection in connections:
+        await connection.close()
 
 @app.get("/missions")
-def get_missions(
+async def get_missions(
     mission_code: str = None,
     mission_type: MissionType = None,
     launch_site: str = None,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(MissionDB)
-    if mission_code:
-        query = query.filter(MissionDB.mission_code == mission_code)
-    if mission_type:
-        query = query.filter(MissionDB.mission_type == mission_type)
-    if launch_site:
-        query = query.filter(MissionDB.launch_site == launch_site)
-    results = query.all()
-    # Преобразование вручную в список словарей
-    results_dict = [{
-        "mission_code": r.mission_code,
-        "mission_name": r.mission_name,
-        "launch_site": r.launch_site,
-        "launch_date": r.launch_date.isoformat(),
-        "mission_type": r.mission_type,
-        "spacecraft": r.spacecraft,
-        "crew_size": r.crew_size
-    } for r in results]
-    return {
-        "message": f"Найдено {len(results)} миссий",
-        "data": results_dict
-    }
+    def apply_filters(stmt):
+        if mission_code:
+            stmt += lambda s: s.where(MissionDB.mission_code == mission_code)
+        if mission_type:
+            stmt += lambda s: s.where(MissionDB.mission_type == mission_type)
+        if launch_site:
+            stmt += lambda s: s.where(MissionDB.launch_site == launch_site)
+        return stmt
+
+    total = await db.scalar(apply_filters(lambda_stmt(lambda: select(func.count()).select_from(MissionDB.__table__))))
+    query = apply_filters(lambda_stmt(lambda: select(MissionDB.__table__)))
+    query += lambda s: s.order_by(MissionDB.mission_code).limit(limit).offset(offset)
+    # "count" — число строк на этой странице
+    result = await db.stream(query, execution_options={"yield_per": 1000})
+
+    async def generate():
+        count = 0
+        yield b'{"message":' + orjson.dumps(f"Найдено {total} миссий") + b',"total":%d,"data":[' % total
+        async for rows in result.partitions():
+            chunk = b",".join(orjson.dumps(row._asdict()) for row in rows)
+            yield chunk if count == 0 else b"," + chunk
+            count += len(rows)
+        yield b'],"count":%d}' % count
+
+    return StreamingResponse(generate(), media_type="application/json")
 
 @app.post("/missions")
-def create_mission(mission: Mission, db: Session = Depends(get_db)):
-    db_mission = db.query(MissionDB).filter(MissionDB.mission_code == mission.mission_code).first()
-    if db_mission:
+async def create_mission(mission: Mission, db: AsyncSession = Depends(get_db)):
+    payload = mission.dict()
+    stmt = sqlite_insert(MissionDB).values(**payload).on_conflict_do_nothing(index_elements=["mission_code"])
+    result = await db.execute(stmt)
+    await db.commit()
+    if result.rowcount == 0:
         raise HTTPException(status_code=400, detail="Миссия с таким кодом уже существует")
-    db_mission = MissionDB(**mission.dict())
-    db.add(db_mission)
-    db.commit()
-    db.refresh(db_mission)
     return {
         "message": "Миссия успешно запланирована",
-        "data": mission.dict()
+        "data": payload
+    }
+
+@app.post("/missions/bulk")
+async def create_missions_bulk(missions: List[Mission], db: AsyncSession = Depends(get_db)):
+    created = 0
+    if missions:
+        stmt = sqlite_insert(MissionDB).on_conflict_do_nothing(index_elements=["mission_code"])
+        connection = await db.connection()
+        result = await connection.execute(stmt, [mission.dict() for mission in missions])
+        await db.commit()
+        created = result.rowcount
+    return {
+        "message": f"Запланировано миссий: {created}, пропущено (код миссии уже существует): {len(missions) - created}",
+        "data": {"created": created, "skipped": len(missions) - created}
     }
 
 @app.put("/missions/{mission_code}")
-def update_mission(mission_code: str, mission: Mission, db: Session = Depends(get_db)):
+async def update_mission(mission_code: str, mission: Mission, db: AsyncSession = Depends(get_db)):
     if mission_code != mission.mission_code:
         raise HTTPException(status_code=400, detail="Код миссии в пути и теле запроса не совпадают")
-    db_mission = db.query(MissionDB).filter(MissionDB.mission_code == mission_code).first()
-    if not db_mission:
+    payload = mission.dict()
+    result = await db.execute(update(MissionDB).where(MissionDB.mission_code == mission_code).values(**payload))
+    await db.commit()
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Миссия не найдена")
-    for key, value in mission.dict().items():
-        setattr(db_mission, key, value)
-    db.commit()
-    db.refresh(db_mission)
     return {
         "message": "Информация о миссии успешно обновлена",
-        "data": mission.dict()
+        "data": payload
     }
 
 @app.delete("/missions/{mission_code}")
-def delete_mission(mission_code: str, db: Session = Depends(get_db)):
-    db_mission = db.query(MissionDB).filter(MissionDB.mission_code == mission_code).first()
+async def delete_mission(mission_code: str, db: AsyncSession = Depends(get_db)):
+    db_mission = (await db.scalars(select(MissionDB).filter(MissionDB.mission_code == mission_code))).first()
     if not db_mission:
         raise HTTPException(status_code=404, detail="Миссия не найдена")
-    db.delete(db_mission)
-    db.commit()
+    await db.delete(db_mission)
+    await db.commit()
     return {
         "message": "Миссия успешно отменена",
         "data": {"mission_code": mission_code}
-    }
\ No newline at end of file
+    }
+
+async def _prepare_db():
+    await init_db()
+    await engine.dispose()
+
+# Запуск: python Mission.py. Переменные окружения: HOST, PORT, WEB_CONCURRENCY (по умолчанию — число ядер)
+if __name__ == "__main__":
+    import asyncio
+    import uvicorn
+
+    asyncio.run(_prepare_db())
+    os.environ["MISSIONS_DB_READY"] = "1"
+    uvicorn.run(
+        "Mission:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8001")),
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        loop="auto",
+        http="auto",
+    )
@@ -1,17 +1,61 @@
 from enum import Enum as PyEnum
-from fastapi import FastAPI, Depends, HTTPException
-from pydantic import BaseModel, validator
-from sqlalchemy import create_engine, Column, String, DateTime, Enum as SQLAlchemyEnum, Float
+from functools import lru_cache
+from typing import Annotated, List
+from fastapi import FastAPI, Depends, Query, HTTPException
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, validator
+from sqlalchemy import Column, String, Integer, DateTime, Float, Index, event, func, lambda_stmt, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
-import re  
+import os
+import time
+import orjson
 
-app = FastAPI()
+# Форматы идентификаторов
+FlightId = Annotated[str, Field(pattern=r'^FL-\d{5}-[A-Z]$')]
+DroneId = Annotated[str, Field(pattern=r'^DRN-\d{4}$')]
 
-DATABASE_URL = "sqlite:///./drone_flights.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+app = FastAPI(default_response_class=ORJSONResponse)
+
+DATABASE_URL = "sqlite+aiosqlite:///./drone_flights.db"
+engine = create_async_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=8,
+    max_overflow=16,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+)
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-65536")
+    cur.execute("PRAGMA mmap_size=268435456")
+    cur.close()
+
+# Периодически обновляет статистику планировщика, когда соединение возвращается в пул
+OPTIMIZE_INTERVAL_SECONDS = 3600
+_last_optimize = -OPTIMIZE_INTERVAL_SECONDS
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _optimize_on_checkin(dbapi_conn, _):
+    global _last_optimize
+    if dbapi_conn is None or time.monotonic() - _last_optimize < OPTIMIZE_INTERVAL_SECONDS:
+        return
+    _last_optimize = time.monotonic()
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA optimize")
+    cur.close()
+
+SessionLocal = async_sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 class CargoType(str, PyEnum):
@@ -22,41 +66,48 @@ class CargoType(str, PyEnum):
 
 class FlightDB(Base):
     __tablename__ = "flights"
+    __table_args__ = (Index("ix_flights_drone_id_cargo_type", "drone_id", "cargo_type"),)
     flight_id = Column(String, primary_key=True, index=True)
     drone_id = Column(String, nullable=False)
     departure_point = Column(String, nullable=False)
     destination = Column(String, nullable=False)
     departure_time = Column(DateTime, nullable=False)
-    cargo_type = Column(SQLAlchemyEnum(CargoType), nullable=False)
+    cargo_type = Column(String, nullable=False, index=True)  # Значение CargoType хранится строкой, проверку выполняет Pydantic
     cargo_weight_kg = Column(Float, nullable=False)
     max_altitude_m = Column(Integer, nullable=False)
 
-Base.metadata.create_all(bind=engine)
+async def init_db():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        # create_all не добавляет новые индексы в уже существующую таблицу
+        for index in FlightDB.__table__.indexes:
+            await connection.run_sync(index.create, checkfirst=True)
+        await connection.exec_driver_sql("ANALYZE")
+
+# При запуске через __main__ схема создаётся один раз до старта воркеров, а не в каждом из них
+@app.on_event("startup")
+async def create_tables():
+    if os.getenv("FLIGHTS_DB_READY") != "1":
+        await init_db()
+
+# Текущее время с точностью до секунды
+@lru_cache(maxsize=1)
+def _cached_now(bucket):
+    return datetime.now()
+
+def _now():
+    return _cached_now(int(time.monotonic()))
 
 class Flight(BaseModel):
-    flight_id: str
-    drone_id: str
+    flight_id: FlightId
+    drone_id: DroneId
     departure_point: str
     destination: str
     departure_time: datetime
     cargo_type: CargoType
-    cargo_weight_kg: float
-    max_altitude_m: int
-
-    @validator("flight_id")
-    def validator_flight_id(cls, flight_id):
-        pattern = r'^FL-\d{5}-[A-Z]$'
-        if not re.match(pattern, flight_id):
-            raise ValueError("ID полета должен иметь формат FL-XXXXX-Z (FL, дефис, 5 цифр, дефис, буква)")
-        return flight_id
-
-    @validator("drone_id")
-    def validator_drone_id(cls, drone_id):
-        pattern = r'^DRN-\d{4}$'
-        if not re.match(pattern, drone_id):
-            raise ValueError("ID дрона должен иметь формат DRN-XXXX (DRN и 4 цифры)")
-        return drone_id
-    
+    cargo_weight_kg: float = Field(gt=0, le=50)
+    max_altitude_m: int = Field(ge=10, le=400)
+
     @validator("departure_point")
     def validator_departure_point(cls, departure_point):
         if len(departure_point.strip()) < 3:
@@ -71,98 +122,128 @@ class Flight(BaseModel):
     
     @validator("departure_time")
     def validator_departure_time(cls, departure_time):
-        current_time = datetime.now()
+        current_time = _now()
         if departure_time < current_time:
             raise ValueError("Время вылета не может быть в прошлом")
         return departure_time
-    
-    @validator("cargo_weight_kg")
-    def validator_cargo_weight(cls, cargo_weight_kg):
-        if cargo_weight_kg <= 0 or cargo_weight_kg > 50:
-            raise ValueError("Вес груза должен быть от 0.1 до 50 кг")
-        return cargo_weight_kg
-    
-    @validator("max_altitude_m")
-    def validator_altitude(cls, max_altitude_m):
-        if max_altitude_m < 10 or max_altitude_m > 400:
-            raise ValueError("Максимальная высота должна быть от 10 до 400 метров")
-        return max_altitude_m
 
-def get_db():
+async def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
+
+@app.on_event("startup")
+async def warm_up_pool():
+    connections = [await engine.connect() for _ in range(2)]
+    for connection in connections:
+        await connection.close()
 
 @app.get("/flights")
-def get_flights(
+async def get_flights(
     flight_id: str = None,
     drone_id: str = None,
     cargo_type: CargoType = None,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db)
 ):
-    query = db.query(FlightDB)
-    if flight_id:
-        query = query.filter(FlightDB.flight_id == flight_id)
-    if drone_id:
-        query = query.filter(FlightDB.drone_id == drone_id)
-    if cargo_type:
-        query = query.filter(FlightDB.cargo_type == cargo_type)
-    results = query.all()
-    results_dict = [{
-        "flight_id": r.flight_id,
-        "drone_id": r.drone_id,
-        "departure_point": r.departure_point,
-        "destination": r.destination,
-        "departure_time": r.departure_time.isoformat(),
-        "cargo_type": r.cargo_type,
-        "cargo_weight_kg": r.cargo_weight_kg,
-        "max_altitude_m": r.max_altitude_m
-    } for r in results]
-    return {
-        "message": f"Найдено {len(results)} полетов",
-        "data": results_dict
-    }
+    def apply_filters(stmt):
+        if flight_id:
+            stmt += lambda s: s.where(FlightDB.flight_id == flight_id)
+        if drone_id:
+            stmt += lambda s: s.where(FlightDB.drone_id == drone_id)
+        if cargo_type:
+            stmt += lambda s: s.where(FlightDB.cargo_type == cargo_type)
+        return stmt
+
+    total = await db.scalar(apply_filters(lambda_stmt(lambda: select(func.count()).select_from(FlightDB.__table__))))
+    query = apply_filters(lambda_stmt(lambda: select(FlightDB.__table__)))
+    query += lambda s: s.order_by(FlightDB.flight_id).limit(limit).offset(offset)
+    # "count" — число строк на этой странице
+    result = await db.stream(query, execution_options={"yield_per": 1000})
+
+    async def generate():
+        count = 0
+        yield b'{"message":' + orjson.dumps(f"Найдено {total} полетов") + b',"total":%d,"data":[' % total
+        async for rows in result.partitions():
+            chunk = b",".join(orjson.dumps(row._asdict()) for row in rows)
+            yield chunk if count == 0 else b"," + chunk
+            count += len(rows)
+        yield b'],"count":%d}' % count
+
+    return StreamingResponse(generate(), media_type="application/json")
 
 @app.post("/flights")
-def create_flight(flight: Flight, db: Session = Depends(get_db)):
-    db_flight = db.query(FlightDB).filter(FlightDB.flight_id == flight.flight_id).first()
-    if db_flight:
+async def create_flight(flight: Flight, db: AsyncSession = Depends(get_db)):
+    payload = flight.dict()
+    stmt = sqlite_insert(FlightDB).values(**payload).on_conflict_do_nothing(index_elements=["flight_id"])
+    result = await db.execute(stmt)
+    await db.commit()
+    if result.rowcount == 0:
         raise HTTPException(status_code=400, detail="Полет с таким ID уже существует")
-    db_flight = FlightDB(**flight.dict())
-    db.add(db_flight)
-    db.commit()
-    db.refresh(db_flight)
     return {
         "message": "Полет успешно запланирован",
-        "data": flight.dict()
+        "data": payload
+    }
+
+@app.post("/flights/bulk")
+async def create_flights_bulk(flights: List[Flight], db: AsyncSession = Depends(get_db)):
+    created = 0
+    if flights:
+        stmt = sqlite_insert(FlightDB).on_conflict_do_nothing(index_elements=["flight_id"])
+        connection = await db.connection()
+        result = await connection.execute(stmt, [flight.dict() for flight in flights])
+        await db.commit()
+        created = result.rowcount
+    return {
+        "message": f"Запланировано полетов: {created}, пропущено (ID полета уже существует): {len(flights) - created}",
+        "data": {"created": created, "skipped": len(flights) - created}
     }
 
 @app.put("/flights/{flight_id}")
-def update_flight(flight_id: str, flight: Flight, db: Session = Depends(get_db)):
+async def update_flight(flight_id: str, flight: Flight, db: AsyncSession = Depends(get_db)):
     if flight_id != flight.flight_id:
         raise HTTPException(status_code=400, detail="ID полета в пути и теле запроса не совпадают")
-    db_flight = db.query(FlightDB).filter(FlightDB.flight_id == flight_id).first()
-    if not db_flight:
+    payload = flight.dict()
+    result = await db.execute(update(FlightDB).where(FlightDB.flight_id == flight_id).values(**payload))
+    await db.commit()
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Полет не найден")
-    for key, value in flight.dict().items():
-        setattr(db_flight, key, value)
-    db.commit()
-    db.refresh(db_flight)
     return {
         "message": "Информация о полете успешно обновлена",
-        "data": flight.dict()
+        "data": payload
     }
 
 @app.delete("/flights/{flight_id}")
-def delete_flight(flight_id: str, db: Session = Depends(get_db)):
-    db_flight = db.query(FlightDB).filter(FlightDB.flight_id == flight_id).first()
+async def delete_flight(flight_id: str, db: AsyncSession = Depends(get_db)):
+    db_flight = (await db.scalars(select(FlightDB).filter(FlightDB.flight_id == flight_id))).first()
     if not db_flight:
         raise HTTPException(status_code=404, detail="Полет не найден")
-    db.delete(db_flight)
-    db.commit()
+    await db.delete(db_flight)
+    await db.commit()
     return {
         "message": "Полет успешно отменен",
         "data": {"flight_id": flight_id}
-    }
\ No newline at end of file
+    }
+
+async def _prepare_db():
+    await init_db()
+    await engine.dispose()
+
+# Запуск: python dron.py. Переменные окружения: HOST, PORT, WEB_CONCURRENCY (по умолчанию — число ядер)
+if __name__ == "__main__":
+    import asyncio
+    import uvicorn
+
+    asyncio.run(_prepare_db())
+    os.environ["FLIGHTS_DB_READY"] = "1"
+    uvicorn.run(
+        "dron:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8002")),
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        loop="auto",
+        http="auto",
+    )